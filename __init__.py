@@ -3,8 +3,8 @@ from bpy.types import Operator, Panel
 from bpy.props import EnumProperty, BoolProperty
 from bpy.app.translations import pgettext
 from . import op_symmetrize
+from . import op_live_mirror
 from . import op_uv_group
-from . import op_uv_preview
 
 bl_info = {
     "name": "Mio3 Symmetry",
@@ -24,6 +24,17 @@ translation_dict = {
         ("*", "UnSymmetrize L/R Facial ShapeKeys"): "L/Rの表情シェイプキーを非対称化",
         ("*", "Remove Mirror Modifier"): "ミラーモディファイアを削除",
         ("*", "Origin to Center"): "原点を基準に対称化",
+        ("*", "Selected Only"): "選択範囲のみ",
+        ("*", "No vertices selected"): "頂点が選択されていません",
+        ("*", "Mirror Tolerance"): "対称位置の許容距離",
+        ("*", "Memory Budget"): "メモリ予算",
+        ("*", "Budget (MB)"): "予算 (MB)",
+        ("*", "Keep Indices"): "インデックスを維持",
+        ("*", "Clean Weights"): "ウェイトを整理",
+        ("*", "Mio3 Live Mirror"): "ライブミラー",
+        ("*", "Mirror edits of vertices, weights and UVs to the other side while editing"): "編集中の頂点・ウェイト・UVの変更を反対側に反映",
+        ("*", "Live Mirror On"): "ライブミラー オン",
+        ("*", "Live Mirror Off"): "ライブミラー オフ",
         ("*", "Object is not a mesh"): "オブジェクトがメッシュではありません",
         ("*", "Symmetrize meshes, shape keys, vertex groups, UVs, and normals while maintaining multi-resolution"): "マルチレゾを維持してメッシュ・シェイプキー・頂点グループ・UV・法線を対称化",
         ("*", "Align to vertex position"): "頂点位置に合わせる",
@@ -33,15 +44,22 @@ translation_dict = {
 }
 
 
+# 重い実行部分・描画部分は初回実行時に読み込む
 modules = [
     op_symmetrize,
+    op_live_mirror,
     op_uv_group,
-    op_uv_preview,
 ]
 
 
 def register():
     bpy.app.translations.register(__name__, translation_dict)
+    # バックグラウンドでは描画しないので UV プレビューを読み込まない
+    if not bpy.app.background:
+        from . import op_uv_preview
+
+        if op_uv_preview not in modules:
+            modules.append(op_uv_preview)
     for module in modules:
         module.register()
 
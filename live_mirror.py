@@ -0,0 +1,308 @@
+import bpy
+import bmesh
+import numpy as np
+from . import symmetry_kernel as kernel
+
+
+# 選択とトランスフォームの操作ではトポロジーは変わらない
+def changes_topology(idname):
+    return not (idname.startswith("TRANSFORM_OT_") or "SELECT" in idname)
+
+
+def geometry_updated(obj, depsgraph):
+    for update in depsgraph.updates:
+        if update.is_updated_geometry and update.id.original in (obj, obj.data):
+            return True
+    return False
+
+
+class LiveMirror:
+    """編集モードとウェイトペイントの変更を対称側へ反映する
+
+    選択中のコピー元側の頂点だけを前回の状態と比べ、変化した座標・ウェイト・UV を対称位置へ書き込む。
+    選択は選択だけが変わった更新で読み直すので、毎回の更新は選択した頂点の数に比例する。
+    対称位置の対応は要素数が変わった時、選択とトランスフォーム以外の操作の後、アンドゥの後に作り直す。
+    ウェイトペイントでマスクを使わない時は Blender の X ミラーに任せる。
+    """
+
+    def __init__(self, obj, mode, tolerance):
+        self.obj_name = obj.name
+        self.mode = mode
+        self.tolerance = tolerance
+        self.counts = None
+        self.operator = None
+        self.selected = None
+        self.paint_mirror = None
+        self.updating = False
+
+    def invalidate(self):
+        self.counts = None
+
+    def update(self, obj, depsgraph):
+        if self.updating:
+            return
+        self.updating = True
+        try:
+            if obj.mode != "WEIGHT_PAINT":
+                self.restore_paint_mirror()
+            if obj.mode == "EDIT":
+                self.update_edit(obj, depsgraph)
+            elif obj.mode == "WEIGHT_PAINT":
+                self.update_weight_paint(obj)
+        finally:
+            self.updating = False
+
+    def close(self):
+        self.restore_paint_mirror()
+
+    def update_edit(self, obj, depsgraph):
+        bm = bmesh.from_edit_mesh(obj.data)
+        if self.topology_changed((len(bm.verts), len(bm.edges), len(bm.faces)), True):
+            self.rebuild(obj, bm)
+        bm.verts.ensure_lookup_table()
+        bm.faces.ensure_lookup_table()
+
+        deform_layer = bm.verts.layers.deform.active
+        read = None
+        if deform_layer is not None:
+            read = lambda i: dict(bm.verts[i][deform_layer].items())
+
+        # 選択だけが変わった更新で選択を読み直し、比較用のウェイトを取り直す
+        if self.selected is None or not geometry_updated(obj, depsgraph):
+            selected = np.fromiter((v.select for v in bm.verts), dtype=bool, count=len(bm.verts))
+            self.select(selected, read)
+            return
+
+        def write(t, weights):
+            dvert = bm.verts[t][deform_layer]
+            for g in [g for g in dvert.keys() if g not in weights]:
+                del dvert[g]
+            for g, w in weights.items():
+                dvert[g] = w
+
+        if self.push_changes(obj, bm, read, write):
+            bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False)
+
+    def update_weight_paint(self, obj):
+        mesh = obj.data
+        # マスクが無い時はどの頂点も塗られるので、Blender の X ミラーで塗る
+        if not (mesh.use_paint_mask_vertex or mesh.use_paint_mask):
+            self.use_paint_mirror(mesh)
+            return
+        self.restore_paint_mirror()
+
+        # ウェイトペイント中はトポロジーは変わらない (アンドゥは invalidate で知らされる)
+        if self.topology_changed((len(mesh.vertices), len(mesh.edges), len(mesh.polygons)), False):
+            bm = bmesh.new()
+            try:
+                bm.from_mesh(mesh)
+                self.rebuild(obj, bm)
+            finally:
+                bm.free()
+
+        vertices = mesh.vertices
+        vgroups = obj.vertex_groups
+        read = lambda i: {elem.group: elem.weight for elem in vertices[i].groups}
+
+        selected = np.empty(len(vertices), dtype=bool)
+        vertices.foreach_get("select", selected)
+        if self.selected is None or not np.array_equal(selected, self.selected_mask):
+            self.select(selected, read)
+            return
+
+        def write(t, weights):
+            for g in [elem.group for elem in vertices[t].groups if elem.group not in weights]:
+                vgroups[g].remove([t])
+            for g, w in weights.items():
+                vgroups[g].add([t], w, "REPLACE")
+
+        if self.push_weights(obj, self.selected, read, write):
+            mesh.update()
+
+    def use_paint_mirror(self, mesh):
+        if self.paint_mirror is None:
+            self.paint_mirror = (mesh.name, mesh.use_mirror_x, mesh.use_mirror_vertex_groups)
+        mesh.use_mirror_x = True
+        mesh.use_mirror_vertex_groups = True
+
+    # ライブミラーを始める前の X ミラーの設定に戻す
+    def restore_paint_mirror(self):
+        if self.paint_mirror is None:
+            return
+        name, use_mirror_x, use_mirror_vertex_groups = self.paint_mirror
+        self.paint_mirror = None
+        mesh = bpy.data.meshes.get(name)
+        if mesh is not None:
+            mesh.use_mirror_x = use_mirror_x
+            mesh.use_mirror_vertex_groups = use_mirror_vertex_groups
+
+    # 要素数が変わったか、トポロジーを変えうる操作が実行された (アンドゥは invalidate で知らされる)
+    def topology_changed(self, counts, check_operator):
+        changed = counts != self.counts
+        if check_operator:
+            operators = bpy.context.window_manager.operators
+            last = operators[-1] if len(operators) else None
+            operator = None if last is None else last.as_pointer()
+            if operator != self.operator:
+                self.operator = operator
+                changed |= last is not None and changes_topology(last.bl_idname)
+        return changed
+
+    # 比較する頂点を選択中のコピー元側の頂点にして、そのウェイトを控える
+    def select(self, selected, read):
+        self.selected_mask = selected
+        self.selected = np.flatnonzero(selected & self.source)
+        self.weights = {}
+        if read is not None:
+            self.weights = {i: read(i) for i in self.selected.tolist()}
+
+    # 対称位置の対応と比較用の状態を作る
+    def rebuild(self, obj, bm):
+        bm.verts.index_update()
+        bm.faces.index_update()
+        bm.verts.ensure_lookup_table()
+        bm.faces.ensure_lookup_table()
+        self.counts = (len(bm.verts), len(bm.edges), len(bm.faces))
+        self.selected = None
+
+        self.co = np.array([v.co[:] for v in bm.verts], dtype=np.float64).reshape(-1, 3)
+        self.mirror = kernel.mirror_map(self.co, self.tolerance)
+        self.source = ~kernel.target_side_mask(self.co[:, 0], self.mode, include_center=False)
+        self.source &= self.mirror >= 0
+
+        # ループは (面, 面内の番号) で参照する
+        loop_verts = []
+        loop_faces = []
+        loop_corners = []
+        for f in bm.faces:
+            for i, loop in enumerate(f.loops):
+                loop_verts.append(loop.vert.index)
+                loop_faces.append(f.index)
+                loop_corners.append(i)
+        self.loop_verts = np.array(loop_verts, dtype=np.int64)
+        self.loop_faces = np.array(loop_faces, dtype=np.int64)
+        self.loop_corners = np.array(loop_corners, dtype=np.int64)
+        self.vert_loops = np.argsort(self.loop_verts, kind="stable")
+        counts = np.bincount(self.loop_verts, minlength=len(bm.verts))
+        self.vert_loop_starts = np.cumsum(counts) - counts
+        self.vert_loop_counts = counts
+        self.loop_mirror = kernel.mirror_loops(
+            self.co,
+            self.loop_verts,
+            self.loop_faces,
+            self.co,
+            self.loop_verts,
+            self.loop_faces,
+            self.tolerance,
+        ).index
+        # コピー元側の面のループ (中心の頂点でも対称側の面のループは書き込み先になる)
+        target_faces = kernel.face_any(
+            kernel.target_side_mask(self.co[:, 0], self.mode, include_center=False),
+            self.loop_verts,
+            self.loop_faces,
+            len(bm.faces),
+        )
+        self.source_loops = ~target_faces[self.loop_faces]
+
+        deform_layer = bm.verts.layers.deform.active
+        self.flip_groups = kernel.flip_group_indices(obj.vertex_groups.keys())
+
+        uv_layer = bm.loops.layers.uv.active
+        self.uv = None
+        if uv_layer is not None:
+            self.uv = np.array(
+                [loop[uv_layer].uv[:] for f in bm.faces for loop in f.loops], dtype=np.float64
+            ).reshape(-1, 2)
+            self.loop_params = self.get_loop_params(obj, bm, deform_layer)
+
+    # ループごとの UV 反転の (u_co, offset_v)
+    def get_loop_params(self, obj, bm, deform_layer):
+        vgroups = obj.vertex_groups
+        items = [item for item in obj.mio3qs.vglist.items if item.vertex_group in vgroups]
+        masks = np.zeros((len(items), len(bm.verts)), dtype=bool)
+        if deform_layer is not None and items:
+            columns = {vgroups[item.vertex_group].index: i for i, item in enumerate(items)}
+            for v in bm.verts:
+                for g in v[deform_layer].keys():
+                    i = columns.get(g)
+                    if i is not None:
+                        masks[i, v.index] = True
+        face_group = kernel.classify_group_faces(masks, self.loop_verts, self.loop_faces, len(bm.faces))
+        params = np.array(
+            [(0.5, 0.0)] + [(item.uv_coord_u, item.uv_offset_v) for item in items], dtype=np.float64
+        )
+        return params[face_group[self.loop_faces] + 1]
+
+    def push_changes(self, obj, bm, read, write):
+        verts = self.selected
+        if not len(verts):
+            return False
+        changed = False
+
+        # 座標
+        co = np.array([bm.verts[i].co[:] for i in verts.tolist()], dtype=np.float64).reshape(-1, 3)
+        moved = np.any(np.abs(co - self.co[verts]) > 1e-7, axis=1)
+        if moved.any():
+            sources = verts[moved]
+            targets = self.mirror[sources]
+            new_co = kernel.reflect(co[moved])
+            new_co[targets == sources, 0] = 0.0
+            for t, c in zip(targets.tolist(), new_co.tolist()):
+                bm.verts[t].co = c
+            self.co[sources] = co[moved]
+            self.co[targets] = new_co
+            changed = True
+
+        if read is not None:
+            changed |= self.push_weights(obj, verts, read, write)
+        changed |= self.push_uvs(bm, verts)
+        return changed
+
+    # read(i) で読んだウェイトが前回と違う頂点だけ、反転して write(対称位置, ウェイト) で書き込む
+    def push_weights(self, obj, verts, read, write):
+        if len(self.flip_groups) != len(obj.vertex_groups):
+            self.flip_groups = kernel.flip_group_indices(obj.vertex_groups.keys())
+        changed = False
+        for i in verts.tolist():
+            t = int(self.mirror[i])
+            # 中心の頂点は左右を入れ替えられないのでそのまま
+            if t == i:
+                continue
+            weights = read(i)
+            if weights == self.weights.get(i):
+                continue
+            mirrored = {self.flip_groups[g]: w for g, w in weights.items() if g < len(self.flip_groups)}
+            write(t, mirrored)
+            self.weights[i] = weights
+            changed = True
+        return changed
+
+    def push_uvs(self, bm, verts):
+        uv_layer = bm.loops.layers.uv.active
+        if uv_layer is None or self.uv is None:
+            return False
+        counts = self.vert_loop_counts[verts]
+        starts = np.repeat(self.vert_loop_starts[verts], counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        loops = self.vert_loops[starts + offsets]
+        loops = loops[self.source_loops[loops] & (self.loop_mirror[loops] >= 0)]
+        if not len(loops):
+            return False
+
+        uv = np.array([self.get_loop(bm, l)[uv_layer].uv[:] for l in loops.tolist()], dtype=np.float64)
+        moved = np.any(np.abs(uv - self.uv[loops]) > 1e-7, axis=1)
+        loops, uv = loops[moved], uv[moved]
+        if not len(loops):
+            return False
+
+        targets = self.loop_mirror[loops]
+        params = self.loop_params[targets]
+        new_uv = kernel.mirror_uv(uv, params[:, 0], params[:, 1])
+        for t, value in zip(targets.tolist(), new_uv.tolist()):
+            self.get_loop(bm, t)[uv_layer].uv = value
+        self.uv[loops] = uv
+        self.uv[targets] = new_uv
+        return True
+
+    def get_loop(self, bm, loop):
+        return bm.faces[int(self.loop_faces[loop])].loops[int(self.loop_corners[loop])]
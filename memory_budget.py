@@ -0,0 +1,63 @@
+import sys
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+
+
+def peak_rss():
+    """プロセスの最大常駐メモリ (バイト)。取得できなければ None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryBudget:
+    """チャンクの大きさを決めて、ステージごとのメモリの増え方を記録する
+
+    limit_mb が None なら分割しない。分割するのは計算用の一時配列で、foreach_get で読む元の配列は
+    範囲を指定して読めないため全体を読む。
+    記録するのは各ステージの間にプロセスの最大常駐メモリが増えた量で、BMesh やメッシュの分も含む。
+    それまでの最大を超えなかった分は数えられず、最大常駐メモリを取得できない環境 (Windows) では記録しない。
+    """
+
+    # 予算のうち1チャンクの作業用配列に使う割合
+    chunk_fraction = 0.25
+    min_chunk = 1024
+
+    def __init__(self, limit_mb=None):
+        self.limit = int(limit_mb * MB) if limit_mb else None
+        self.measure = self.limit is not None and resource is not None
+        self.peaks = {}
+
+    def chunks(self, count, row_bytes):
+        """count 行を row_bytes バイト/行 で予算に収まる大きさに分けた slice"""
+        if self.limit is None or count == 0:
+            size = max(count, 1)
+        else:
+            size = max(self.min_chunk, int(self.limit * self.chunk_fraction // max(row_bytes, 1)))
+        for start in range(0, count, size):
+            yield slice(start, min(start + size, count))
+
+    @contextmanager
+    def stage(self, name):
+        if not self.measure:
+            yield
+            return
+        base = peak_rss()
+        try:
+            yield
+        finally:
+            self.peaks[name] = self.peaks.get(name, 0) + peak_rss() - base
+
+    def over_budget(self):
+        return [name for name, peak in self.peaks.items() if peak > self.limit]
+
+    def summary(self):
+        return "  ".join(f"{name}: {peak / MB:.1f}" for name, peak in self.peaks.items())
@@ -0,0 +1,127 @@
+import bpy
+from bpy.types import Operator
+from bpy.props import EnumProperty, FloatProperty
+from bpy.app.translations import pgettext
+
+# 実行中のライブミラー (live_mirror.LiveMirror)
+session = None
+
+
+class MIO3_OT_live_mirror(Operator):
+    bl_idname = "object.mio3_live_mirror"
+    bl_label = "Mio3 Live Mirror"
+    bl_description = "Mirror edits of vertices, weights and UVs to the other side while editing"
+    bl_options = {"REGISTER"}
+
+    mode: EnumProperty(
+        name="Mode",
+        default="+X",
+        items=[
+            ("+X", "+X → -X", ""),
+            ("-X", "-X → +X", ""),
+        ],
+    )
+    tolerance: FloatProperty(
+        name="Mirror Tolerance",
+        default=0.0001,
+        min=0.000001,
+        max=0.1,
+        precision=6,
+        step=0.001,
+    )
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.type == "MESH"
+
+    def invoke(self, context, event):
+        # 開始時だけモードと許容距離を選ぶ
+        if session is not None:
+            return self.execute(context)
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        global session
+        if session is not None:
+            stop()
+            self.report({"INFO"}, "Live Mirror Off")
+            return {"FINISHED"}
+
+        # 実行部分は初回実行時に読み込む
+        from .live_mirror import LiveMirror
+
+        session = LiveMirror(context.active_object, self.mode, self.tolerance)
+        if depsgraph_handler not in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.append(depsgraph_handler)
+        for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+            if undo_handler not in handlers:
+                handlers.append(undo_handler)
+        self.report({"INFO"}, "Live Mirror On")
+        return {"FINISHED"}
+
+
+def stop():
+    global session
+    if session is not None:
+        session.close()
+    session = None
+    if depsgraph_handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(depsgraph_handler)
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if undo_handler in handlers:
+            handlers.remove(undo_handler)
+
+
+def is_running():
+    return session is not None
+
+
+@bpy.app.handlers.persistent
+def depsgraph_handler(scene, depsgraph):
+    if session is None:
+        return
+    obj = bpy.context.active_object
+    if obj is None or obj.name != session.obj_name:
+        return
+    session.update(obj, depsgraph)
+
+
+# アンドゥで戻ったメッシュには前回の対応が合わないので作り直させる
+@bpy.app.handlers.persistent
+def undo_handler(*args):
+    if session is not None:
+        session.invalidate()
+
+
+@bpy.app.handlers.persistent
+def load_handler(dummy):
+    stop()
+
+
+def menu_transform(self, context):
+    self.layout.operator(
+        MIO3_OT_live_mirror.bl_idname,
+        text=pgettext(MIO3_OT_live_mirror.bl_label),
+        icon="CHECKBOX_HLT" if is_running() else "CHECKBOX_DEHLT",
+    )
+
+
+classes = [MIO3_OT_live_mirror]
+
+
+def register():
+    bpy.types.VIEW3D_MT_object.append(menu_transform)
+    bpy.types.VIEW3D_MT_edit_mesh.append(menu_transform)
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.app.handlers.load_post.append(load_handler)
+
+
+def unregister():
+    stop()
+    bpy.app.handlers.load_post.remove(load_handler)
+    for cls in classes:
+        bpy.utils.unregister_class(cls)
+    bpy.types.VIEW3D_MT_edit_mesh.remove(menu_transform)
+    bpy.types.VIEW3D_MT_object.remove(menu_transform)
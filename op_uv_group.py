@@ -9,7 +9,6 @@ from bpy.props import (
     CollectionProperty,
 )
 import bmesh
-from .op_uv_preview import MIO3QS_OT_UvPreview
 
 
 class MIO3QS_OT_GroupAdd(Operator):
@@ -215,6 +214,11 @@ class MIO3QS_UL_GroupList(UIList):
 
 
 def update_props(self, context):
+    # バックグラウンドではプレビューを登録しない
+    if bpy.app.background:
+        return
+    from .op_uv_preview import MIO3QS_OT_UvPreview
+
     MIO3QS_OT_UvPreview.redraw(context)
 
 
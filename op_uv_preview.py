@@ -1,7 +1,5 @@
 import bpy
 import bmesh
-import gpu
-from gpu_extras.batch import batch_for_shader
 
 mio3qs_preview_msgbus = object()
 
@@ -63,6 +61,8 @@ class MIO3QS_OT_UvPreview(bpy.types.Operator):
 
     @classmethod
     def __draw(cls, context):
+        from gpu_extras.batch import batch_for_shader
+
         # cls.update_mesh(context)
         viewport_vertices = [
             cls.__region.view2d.view_to_region(v[0], v[1], clip=False) for v in cls.__vertices
@@ -79,6 +79,8 @@ class MIO3QS_OT_UvPreview(bpy.types.Operator):
 
     @classmethod
     def handle_add(cls, context):
+        import gpu
+
         cls.__handle = bpy.types.SpaceImageEditor.draw_handler_add(
             cls.__draw, (context,), "WINDOW", "POST_PIXEL"
         )
@@ -102,53 +104,61 @@ class MIO3QS_OT_UvPreview(bpy.types.Operator):
 
     @classmethod
     def update_mesh(cls, context):
+        import numpy as np
+        from . import symmetry_kernel as kernel
+
         cls.__vertices = []
         if cls.is_running():
             obj = context.active_object
             bm = bmesh.from_edit_mesh(obj.data)
             uv_layer = bm.loops.layers.uv.active
             deform_layer = bm.verts.layers.deform.active
-
-            def mirror_uv(uv, u_co, offset_v):
-                mirrored_uv = uv.copy()
-                if abs(mirrored_uv.x - u_co) < 0.0001:
-                    mirrored_uv.x = u_co
-                mirrored_uv.x = u_co + (u_co - mirrored_uv.x)
-                if offset_v:
-                    mirrored_uv.y += offset_v
-                return mirrored_uv
-
-            face_groups = {}
-            processed_faces = set()
-
-            for item in obj.mio3qs.vglist.items:
-                vg = obj.vertex_groups.get(item.vertex_group)
-                if vg:
-                    face_groups[item.vertex_group] = set()
-                    for f in bm.faces:
-                        if f not in processed_faces:
-                            try:
-                                if all(vg.index in v[deform_layer] for v in f.verts):
-                                    face_groups[item.vertex_group].add(f)
-                                    processed_faces.add(f)
-                            except:
-                                pass
-
+            if not uv_layer or not bm.faces:
+                return
+            bm.verts.index_update()
+            bm.faces.index_update()
+
+            items = [
+                item for item in obj.mio3qs.vglist.items if item.vertex_group in obj.vertex_groups
+            ]
+            columns = {obj.vertex_groups[item.vertex_group].index: i for i, item in enumerate(items)}
+
+            group_masks = np.zeros((len(items), len(bm.verts)), dtype=bool)
+            if deform_layer is not None and columns:
+                for v in bm.verts:
+                    for g in v[deform_layer].keys():
+                        i = columns.get(g)
+                        if i is not None:
+                            group_masks[i, v.index] = True
+
+            loop_verts = []
+            loop_faces = []
+            uvs = []
             for face in bm.faces:
-                poly_uvs = [loop[uv_layer].uv.copy() for loop in face.loops]
-                if face in processed_faces:
-                    for item in obj.mio3qs.vglist.items:
-                        if face in face_groups.get(item.vertex_group, set()):
-                            poly_uvs = [
-                                mirror_uv(uv, item.uv_coord_u, item.uv_offset_v)
-                                for uv in poly_uvs
-                            ]
-                            break
-                else:
-                    poly_uvs = [mirror_uv(uv, 0.5, 0) for uv in poly_uvs]
-                
-                for i in range(len(poly_uvs)):
-                    cls.__vertices.extend([poly_uvs[i], poly_uvs[(i + 1) % len(poly_uvs)]])
+                for loop in face.loops:
+                    loop_verts.append(loop.vert.index)
+                    loop_faces.append(face.index)
+                    uvs.append(loop[uv_layer].uv[:])
+
+            face_count = len(bm.faces)
+            loop_verts = np.array(loop_verts, dtype=np.int64)
+            loop_faces = np.array(loop_faces, dtype=np.int64)
+            face_group = kernel.classify_group_faces(group_masks, loop_verts, loop_faces, face_count)
+            uvs = kernel.symmetrize_uv(
+                uvs,
+                loop_faces,
+                face_group,
+                np.ones(face_count, dtype=bool),
+                [(item.uv_coord_u, item.uv_offset_v) for item in items],
+            )
+
+            # 面ごとに隣のループと結ぶ
+            next_loops = np.arange(len(loop_faces)) + 1
+            face_ends = np.flatnonzero(np.diff(loop_faces, append=-1))
+            face_starts = np.concatenate(([0], face_ends[:-1] + 1))
+            next_loops[face_ends] = face_starts
+            lines = np.stack((uvs, uvs[next_loops]), axis=1).reshape(-1, 2)
+            cls.__vertices = lines.tolist()
 
             bm.free()
 
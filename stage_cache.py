@@ -0,0 +1,92 @@
+import hashlib
+
+# ReDo パネルでオプションを切り替えた時に再計算を省くためのステージ別キャッシュ
+# stage -> (key, value) を1件ずつ保持する
+_entries = {}
+# invoke ごとに進める実行の番号。スクリプトからの実行など ReDo 以外ではキャッシュを使わない
+_session = 0
+# 実行中はキャッシュを解放しない
+running = False
+
+# これより頂点の多いメッシュは対称化後の BMesh を複製して持たない (メモリが倍になるため)
+GEOMETRY_VERT_LIMIT = 500000
+
+
+def begin():
+    """新しい実行を始めて、その番号を返す (前回のステージ結果は捨てる)"""
+    global _session
+    clear()
+    _session += 1
+    return _session
+
+
+def is_current(session):
+    return session is not None and session == _session
+
+
+def mesh_key(obj):
+    import numpy as np
+
+    mesh = obj.data
+    h = hashlib.blake2b(digest_size=16)
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    h.update(co.tobytes())
+
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    h.update(loop_verts.tobytes())
+
+    if mesh.shape_keys:
+        for key in mesh.shape_keys.key_blocks:
+            key.data.foreach_get("co", co)
+            h.update(key.name.encode())
+            h.update(co.tobytes())
+
+    return (
+        obj.name,
+        mesh.name,
+        len(mesh.vertices),
+        len(mesh.edges),
+        len(mesh.polygons),
+        h.hexdigest(),
+    )
+
+
+def get(stage, key):
+    entry = _entries.get(stage)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    return None
+
+
+def store(stage, key, value):
+    discard(stage)
+    _entries[stage] = (key, value)
+
+
+def is_empty():
+    return not _entries
+
+
+def discard(stage):
+    entry = _entries.pop(stage, None)
+    if entry is not None:
+        _free(entry[1])
+
+
+def clear():
+    for stage in list(_entries):
+        discard(stage)
+
+
+def _free(value):
+    # BMesh はコピーを保持しているので明示的に解放する
+    if isinstance(value, tuple):
+        for v in value:
+            _free(v)
+        return
+    free = getattr(value, "free", None)
+    if callable(free):
+        free()
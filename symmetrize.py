@@ -0,0 +1,650 @@
+import bpy
+import bmesh
+import numpy as np
+import time
+from itertools import chain
+from . import stage_cache
+from . import op_symmetrize
+from .memory_budget import MemoryBudget
+from . import symmetry_kernel as kernel
+
+TMP_SRC_LAYER_NAME = "Mio3qsTempSrc"
+TMP_INDEX_LAYER_NAME = "Mio3qsTempIndex"
+
+
+class Symmetrize:
+    """MIO3_OT_quick_symmetrize の実行部分"""
+
+    options = (
+        "mode",
+        "facial",
+        "normal",
+        "uvmap",
+        "center",
+        "remove_mirror_mod",
+        "selected_only",
+        "tolerance",
+        "use_memory_budget",
+        "memory_budget",
+        "keep_indices",
+        "clean_weights",
+        "weight_threshold",
+        "limit_total",
+        "normalize",
+    )
+    states = (
+        "original_cursor_location",
+        "original_active_shape_key_index",
+        "original_active_vertex_groups_index",
+        "original_location",
+        "cache_session",
+    )
+
+    def __init__(self, operator):
+        self.operator = operator
+        for name in self.options:
+            setattr(self, name, getattr(operator, name))
+        for name in self.states:
+            setattr(self, name, getattr(operator, name, None))
+
+    def report(self, type, message):
+        self.operator.report(type, message)
+
+    def execute(self, context):
+        # メモリ予算モードでは大きな配列をチャンクに分けて処理する
+        self.budget = MemoryBudget(self.memory_budget if self.use_memory_budget else None)
+        return self.run(context)
+
+    def run(self, context):
+        start_time = time.time()
+        self.obj = context.active_object
+        obj = self.obj
+
+        # total_vert_sel はオブジェクトモードでスクリプトから選択した分を数えないので配列で確かめる
+        if self.selected_only:
+            selected = np.empty(len(obj.data.vertices), dtype=bool)
+            obj.data.vertices.foreach_get("select", selected)
+            if not selected.any():
+                self.report({"ERROR"}, "No vertices selected")
+                return {"CANCELLED"}
+
+        for o in bpy.context.scene.objects:
+            if o != obj:
+                o.select_set(False)
+
+        # 状態を保存
+        if self.center and obj.location.x != 0:
+            bpy.context.scene.cursor.location = (0,) + self.original_location[1:]
+            bpy.ops.object.origin_set(type="ORIGIN_CURSOR", center="MEDIAN")
+            bpy.ops.object.transform_apply(location=False, rotation=True, scale=False)
+
+        for mod in self.obj.modifiers:
+            if self.remove_mirror_mod and mod.type == "MIRROR":
+                obj.modifiers.remove(mod)
+
+        vart_count_1 = len(self.obj.data.vertices)
+
+        orig_shapekey_weights = []
+        if self.obj.data.shape_keys:
+            for key in self.obj.data.shape_keys.key_blocks:
+                orig_shapekey_weights.append(key.value)
+                key.value = 0
+            self.obj.active_shape_key_index = 0
+
+        orig_modifier_states = []
+        for mod in self.obj.modifiers:
+            orig_modifier_states.append(mod.show_viewport)
+            mod.show_viewport = False
+
+        # 選択範囲のみ: 選択頂点とその対称位置の頂点だけを対称化する
+        region_input = self.get_region_input() if self.selected_only else None
+
+        # ReDo 時は入力メッシュとオプションが同じステージの結果を再利用する
+        if not stage_cache.is_current(self.cache_session):
+            stage_cache.clear()
+        region_key = (region_input[2], self.tolerance) if region_input else None
+        self.geometry_key = (stage_cache.mesh_key(obj), self.mode, region_key, self.keep_indices)
+        use_normal = self.normal and self.obj.data.has_custom_normals
+        # 法線のループの照合は許容距離にもよる
+        self.normal_key = (self.geometry_key, self.tolerance)
+        cached_normals = stage_cache.get("normal", self.normal_key) if use_normal else None
+
+        # 法線は対称化前のループから反転してコピーする
+        src_normals = None
+        if use_normal and cached_normals is None:
+            with self.budget.stage("Normal"):
+                src_normals = (self.get_vert_co(), *self.get_loops()[:2], self.get_loop_normals())
+        self.match_stats = {}
+
+        cached = stage_cache.get("geometry", self.geometry_key)
+        if cached is not None:
+            cached[0].to_mesh(self.obj.data)
+
+        bpy.ops.object.mode_set(mode="EDIT")
+
+        # 対称化
+
+        bm = bmesh.from_edit_mesh(self.obj.data)
+
+        with self.budget.stage("Geometry"):
+            index_layers = None
+            if cached is None and self.keep_indices:
+                index_layers = self.add_index_layers(bm)
+
+            if cached is not None:
+                self.region, self.index_map = cached[1:]
+            elif region_input is not None:
+                self.region = self.symmetrize_region(bm, *region_input[:2])
+            else:
+                # bmesh.ops の入力は1つのシーケンスにまとめる必要がある
+                bmesh.ops.symmetrize(
+                    bm,
+                    input=list(chain(bm.verts, bm.edges, bm.faces)),
+                    direction="X" if self.mode == "+X" else "-X",
+                    use_shapekey=True,
+                    dist=0.00001,
+                )
+
+                for elem in chain(bm.verts, bm.edges, bm.faces):
+                    elem.hide_set(False)
+                    elem.select_set(False)
+
+                select_condition = lambda x: x <= 0 if self.mode == "+X" else x >= 0
+                for v in bm.verts:
+                    if select_condition(v.co.x):
+                        v.select = True
+
+                self.region = None
+
+            if index_layers is not None:
+                self.index_map, vert_index = self.restore_order(bm, index_layers)
+                if self.region is not None:
+                    self.region = np.sort(vert_index[self.region])
+            elif cached is None:
+                self.index_map = None
+
+            # メモリ予算モードと大きなメッシュでは BMesh の複製を持たない
+            if cached is None and self.budget.limit is None and len(bm.verts) <= stage_cache.GEOMETRY_VERT_LIMIT:
+                stage_cache.store("geometry", self.geometry_key, (bm.copy(), self.region, self.index_map))
+
+            if self.index_map is not None:
+                op_symmetrize.index_maps[self.obj.data.name] = self.index_map
+            else:
+                op_symmetrize.index_maps.pop(self.obj.data.name, None)
+
+            bm.verts.index_update()
+            bm.verts.ensure_lookup_table()
+            if self.region is None:
+                verts = bm.verts
+                vert_indices = slice(None)
+            else:
+                verts = [bm.verts[i] for i in self.region.tolist()]
+                vert_indices = self.region
+            self.co = np.fromiter(
+                chain.from_iterable(v.co for v in verts), dtype=np.float64, count=len(verts) * 3
+            ).reshape(-1, 3)
+
+        # UVグループの判定は頂点グループの反転前の所属で行う
+        deform_layer = bm.verts.layers.deform.active
+        uv_groups = self.get_uv_groups() if self.uvmap else ()
+        uv_masks = None
+        if uv_groups:
+            uv_key = (self.geometry_key, uv_groups)
+            uv_masks = stage_cache.get("uv_groups", uv_key)
+            if uv_masks is None:
+                _, assigned = self.read_weights(verts, deform_layer, [i for _, i in uv_groups])
+                uv_masks = np.zeros((len(uv_groups), len(bm.verts)), dtype=bool)
+                uv_masks[:, vert_indices] = assigned.T
+                stage_cache.store("uv_groups", uv_key, uv_masks)
+
+        with self.budget.stage("Vertex Groups"):
+            self.symm_vgroups(verts, deform_layer)
+
+        bmesh.update_edit_mesh(self.obj.data)
+        bpy.ops.object.mode_set(mode="OBJECT")
+
+        co = self.get_vert_co()
+        loop_verts, loop_faces, face_count = self.get_loops()
+
+        region_mask = None
+        if self.region is not None:
+            region_mask = np.zeros(len(co), dtype=bool)
+            region_mask[self.region] = True
+
+        target_verts = kernel.target_side_mask(co[:, 0], self.mode)
+        # 片側の面
+        target_faces = kernel.face_any(
+            kernel.target_side_mask(co[:, 0], self.mode, include_center=False),
+            loop_verts,
+            loop_faces,
+            face_count,
+        )
+        if region_mask is not None:
+            target_verts &= region_mask
+            target_faces &= kernel.face_all(region_mask, loop_verts, loop_faces, face_count)
+
+        if self.uvmap:
+            with self.budget.stage("UV"):
+                self.symm_uv(loop_verts, loop_faces, target_faces, uv_groups, uv_masks)
+
+        if self.facial:
+            with self.budget.stage("Shape Keys"):
+                self.unsymm_facial(target_verts)
+
+        if use_normal:
+            with self.budget.stage("Normal"):
+                if cached_normals is not None:
+                    self.restore_normals(cached_normals)
+                else:
+                    self.symm_normal(co, loop_verts, loop_faces, target_faces, src_normals)
+
+        # 状態を戻す
+        if self.obj.data.shape_keys:
+            for i, weight in enumerate(orig_shapekey_weights):
+                self.obj.data.shape_keys.key_blocks[i].value = weight
+        for i, state in enumerate(orig_modifier_states):
+            self.obj.modifiers[i].show_viewport = state
+
+        if self.original_active_shape_key_index is not None:
+            self.obj.active_shape_key_index = self.original_active_shape_key_index
+
+        if self.original_active_vertex_groups_index is not None:
+            obj.vertex_groups.active_index = self.original_active_vertex_groups_index
+
+        if self.original_cursor_location is not None:
+            bpy.context.scene.cursor.location = self.original_cursor_location
+
+        if self.obj.mode != "OBJECT":
+            bpy.ops.object.mode_set(mode="OBJECT")
+
+        vart_count_2 = len(self.obj.data.vertices)
+        stime = time.time() - start_time
+        self.report({"INFO"}, f"Mio3 Symmetry Vertex Count {vart_count_1} → {vart_count_2}  Time: {stime:.4f}")  # fmt:skip
+        for stage, (unmatched, ambiguous) in self.match_stats.items():
+            if unmatched or ambiguous:
+                self.report({"WARNING"}, f"Mio3 Symmetry {stage}: Unmatched {unmatched}  Ambiguous {ambiguous}")  # fmt:skip
+        if self.budget.peaks:
+            self.report({"INFO"}, f"Mio3 Symmetry Peak Memory Increase (MB) {self.budget.summary()}")
+            over = self.budget.over_budget()
+            if over:
+                self.report({"WARNING"}, f"Mio3 Symmetry Over Memory Budget: {', '.join(over)}")
+        return {"FINISHED"}
+
+    def get_vert_co(self):
+        mesh = self.obj.data
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        return co.reshape(-1, 3)
+
+    # ループの頂点と面
+    def get_loops(self):
+        mesh = self.obj.data
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_verts)
+        face_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+        face_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", face_starts)
+        mesh.polygons.foreach_get("loop_total", face_totals)
+        loop_faces = kernel.loop_faces_from_polygons(face_starts, face_totals, len(mesh.loops))
+        return loop_verts, loop_faces, len(mesh.polygons)
+
+    # 選択頂点と、その対称位置にある頂点を対称化の範囲にする
+    def get_region_input(self):
+        mesh = self.obj.data
+        selected = np.empty(len(mesh.vertices), dtype=bool)
+        mesh.vertices.foreach_get("select", selected)
+        co = self.get_vert_co()
+
+        mirror = kernel.mirror_map(co, self.tolerance)
+        # 対称側だけを選んだ場合も、コピー元側の対称位置の頂点を範囲に入れる
+        region = selected.copy()
+        counterparts = mirror[selected]
+        region[counterparts[counterparts >= 0]] = True
+        region_verts = np.flatnonzero(region)
+        return region_verts, mirror, hash(region_verts.tobytes())
+
+    # 範囲内の要素だけを対称化して、範囲外の頂点とつなぎ直す
+    def symmetrize_region(self, bm, region_verts, mirror):
+        # レイヤーの追加で要素の参照が無効になるので、先に作ってから要素を取る
+        src_layer = bm.verts.layers.int.new(TMP_SRC_LAYER_NAME)
+        bm.verts.ensure_lookup_table()
+        verts = [bm.verts[i] for i in region_verts.tolist()]
+        vert_set = set(verts)
+        faces = {f for v in verts for f in v.link_faces if all(fv in vert_set for fv in f.verts)}
+        edges = {e for v in verts for e in v.link_edges if e.verts[0] in vert_set and e.verts[1] in vert_set}
+
+        # 範囲外の面や辺が使っている対称側の頂点は削除させずに残す
+        target_condition = lambda x: x < 0 if self.mode == "+X" else x > 0
+        boundary = {}
+        input_verts = []
+        for i, v in zip(region_verts.tolist(), verts):
+            if target_condition(v.co.x) and (
+                any(f not in faces for f in v.link_faces) or any(e not in edges for e in v.link_edges)
+            ):
+                boundary[i] = v
+            else:
+                input_verts.append(v)
+
+        # 残した頂点を使う範囲内の辺と面は二等分で消えずに複製と重なるので、入力から外す
+        # 対称側だけの辺と面は先に削除して、複製を残した頂点に溶接する
+        kept_verts = set(boundary.values())
+        source_condition = lambda x: x > 0 if self.mode == "+X" else x < 0
+        touching_faces = {f for f in faces if any(v in kept_verts for v in f.verts)}
+        touching_edges = {e for e in edges if any(v in kept_verts for v in e.verts)}
+        faces -= touching_faces
+        edges -= touching_edges
+        remove_faces = [f for f in touching_faces if not any(source_condition(v.co.x) for v in f.verts)]
+        bmesh.ops.delete(bm, geom=remove_faces, context="FACES_ONLY")
+
+        for i, v in zip(region_verts.tolist(), verts):
+            if not target_condition(v.co.x):
+                v[src_layer] = i + 1
+
+        ret = bmesh.ops.symmetrize(
+            bm,
+            input=input_verts + list(edges) + list(faces),
+            direction="X" if self.mode == "+X" else "-X",
+            use_shapekey=True,
+            dist=0.00001,
+        )
+        out_verts = [ele for ele in ret["geom"] if isinstance(ele, bmesh.types.BMVert)]
+
+        # 複製された境界の頂点を、残しておいた頂点に溶接する
+        weld = {}
+        welded = set()
+        for v in out_verts:
+            src = v[src_layer] - 1
+            if src >= 0 and target_condition(v.co.x):
+                kept = boundary.get(int(mirror[src]))
+                if kept is not None and kept not in welded:
+                    kept.co = v.co
+                    weld[v] = kept
+                    welded.add(kept)
+        if weld:
+            bmesh.ops.weld_verts(bm, targetmap=weld)
+
+        result = {v for v in verts if v.is_valid}
+        result.update(v for v in out_verts if v.is_valid)
+        for v in result:
+            v.hide_set(False)
+            v.select = True
+
+        bm.verts.index_update()
+        region = np.array(sorted(v.index for v in result), dtype=np.int64)
+        bm.verts.layers.int.remove(src_layer)
+        return region
+
+    # 対称化前のインデックスを一時レイヤーに記録する (複製された要素には元の値がコピーされる)
+    def add_index_layers(self, bm):
+        layers = []
+        for seq in (bm.verts, bm.edges, bm.faces):
+            layer = seq.layers.int.new(TMP_INDEX_LAYER_NAME)
+            for i, elem in enumerate(seq, 1):
+                elem[layer] = i
+            layers.append((layer, len(seq)))
+
+        layer = bm.loops.layers.int.new(TMP_INDEX_LAYER_NAME)
+        loop_count = 0
+        for f in bm.faces:
+            for loop in f.loops:
+                loop_count += 1
+                loop[layer] = loop_count
+        layers.append((layer, loop_count))
+        return layers
+
+    # コピー元側の要素を元のインデックスに戻し、複製された要素をその後ろに並べる
+    def restore_order(self, bm, layers):
+        def read(elems, layer, count):
+            return np.fromiter((elem[layer] for elem in elems), dtype=np.int64, count=count) - 1
+
+        source_side = lambda x: ~kernel.target_side_mask(x, self.mode, include_center=False)
+        sides = (
+            np.fromiter((v.co.x for v in bm.verts), dtype=np.float64, count=len(bm.verts)),
+            np.fromiter((e.verts[0].co.x + e.verts[1].co.x for e in bm.edges), dtype=np.float64, count=len(bm.edges)),
+            np.fromiter((f.calc_center_median().x for f in bm.faces), dtype=np.float64, count=len(bm.faces)),
+        )
+
+        maps = []
+        new_indices = []
+        primaries = []
+        for seq, (layer, old_count), x in zip((bm.verts, bm.edges, bm.faces), layers, sides):
+            seq.index_update()
+            src = read(seq, layer, len(seq))
+            primary = kernel.primary_elements(src, source_side(x))
+            new_index = kernel.stable_order(src, primary)
+            keys = new_index.tolist()
+            seq.sort(key=lambda elem: keys[elem.index])
+            seq.index_update()
+            seq.layers.int.remove(layer)
+            maps.append(kernel.old_to_new(src, primary, new_index, old_count))
+            new_indices.append(new_index)
+            primaries.append(primary)
+
+        # ループは面の順に並ぶので、並べ替えた面の順で読む
+        layer, old_count = layers[3]
+        totals = np.fromiter((len(f.loops) for f in bm.faces), dtype=np.int64, count=len(bm.faces))
+        loop_src = read((loop for f in bm.faces for loop in f.loops), layer, int(totals.sum()))
+        face_primary = np.empty(len(bm.faces), dtype=bool)
+        face_primary[new_indices[2]] = primaries[2]
+        loop_primary = kernel.primary_elements(loop_src, np.repeat(face_primary, totals))
+        maps.append(kernel.old_to_new(loop_src, loop_primary, np.arange(len(loop_src)), old_count))
+        bm.loops.layers.int.remove(layer)
+
+        return kernel.IndexMap(*maps), new_indices[0]
+
+    # 頂点ウェイトを配列で読む (行は verts の順)
+    def read_weights(self, verts, deform_layer, group_indices):
+        columns = {g: i for i, g in enumerate(group_indices)}
+        weights = np.zeros((len(verts), len(columns)), dtype=np.float64)
+        assigned = np.zeros(weights.shape, dtype=bool)
+        if deform_layer is None:
+            return weights, assigned
+        for row, v in enumerate(verts):
+            for g, w in v[deform_layer].items():
+                i = columns.get(g)
+                if i is not None:
+                    weights[row, i] = w
+                    assigned[row, i] = True
+        return weights, assigned
+
+    # 変化した頂点だけ書き戻す
+    def write_weights(self, verts, deform_layer, group_indices, weights, assigned, old_weights, old_assigned):
+        changed = np.flatnonzero(
+            np.any((weights != old_weights) | (assigned != old_assigned), axis=1)
+        )
+        if not len(changed):
+            return
+        for vi in changed.tolist():
+            dvert = verts[vi][deform_layer]
+            for i, g in enumerate(group_indices):
+                if assigned[vi, i]:
+                    dvert[g] = weights[vi, i]
+                elif g in dvert:
+                    del dvert[g]
+
+    # 対称位置の頂点
+    def get_mirror_map(self):
+        key = (self.geometry_key, self.tolerance)
+        match = stage_cache.get("mirror_map", key)
+        if match is None:
+            match = kernel.mirror_verts(self.co, self.tolerance)
+            stage_cache.store("mirror_map", key, match)
+        self.match_stats["Vertex Groups"] = (len(match.unmatched), len(match.ambiguous))
+        return match.index
+
+    def get_uv_groups(self):
+        vgroups = self.obj.vertex_groups
+        return tuple(
+            (item.vertex_group, vgroups[item.vertex_group].index)
+            for item in self.obj.mio3qs.vglist.items
+            if item.vertex_group in vgroups
+        )
+
+    # UV
+    def symm_uv(self, loop_verts, loop_faces, target_faces, uv_groups, uv_masks):
+        mesh = self.obj.data
+        uv_layer = mesh.uv_layers.active
+        if not uv_layer:
+            return
+
+        face_count = len(target_faces)
+        if uv_groups:
+            face_group = kernel.classify_group_faces(uv_masks, loop_verts, loop_faces, face_count)
+        else:
+            face_group = np.full(face_count, -1, dtype=np.int32)
+
+        items = {item.vertex_group: item for item in self.obj.mio3qs.vglist.items}
+        group_params = [(items[name].uv_coord_u, items[name].uv_offset_v) for name, _ in uv_groups]
+
+        uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        uv_layer.data.foreach_get("uv", uv)
+        uv = uv.reshape(-1, 2)
+        # 1ループあたり: float64 の UV のコピー・(u_co, offset_v)・反転した UV と、ループとグループの int64 のインデックス
+        row_bytes = (3 * 2 + 2) * np.dtype(np.float64).itemsize
+        for chunk in self.budget.chunks(len(uv), row_bytes):
+            uv[chunk] = kernel.symmetrize_uv(uv[chunk], loop_faces[chunk], face_group, target_faces, group_params)
+        uv_layer.data.foreach_set("uv", uv.ravel())
+
+    # 頂点ウェイト
+    def symm_vgroups(self, verts, deform_layer):
+        pairs = kernel.mirror_group_pairs(self.obj.vertex_groups.keys(), self.mode)
+        clean_groups = self.get_clean_groups() if self.clean_weights else []
+        if not pairs and not clean_groups:
+            return
+        group_indices = []
+        for pair in pairs:
+            for g in pair:
+                if g not in group_indices:
+                    group_indices.append(g)
+        group_indices += [g for g in clean_groups if g not in group_indices]
+        columns = {g: i for i, g in enumerate(group_indices)}
+        self.clean_columns = [columns[g] for g in clean_groups]
+        flip = list(range(len(group_indices)))
+        for g, f in pairs:
+            flip[columns[g]] = columns[f]
+            flip[columns[f]] = columns[g]
+
+        mirror = self.get_mirror_map() if pairs else np.full(len(verts), -1, dtype=np.int64)
+        # 書き込むのは対称化で上書きされる側の頂点だけ
+        mirror = kernel.target_mirror(mirror, kernel.target_side_mask(self.co[:, 0], self.mode))
+        is_dest = mirror >= 0
+        dest = np.flatnonzero(is_dest)
+        # 読み込み先も書き込み先になる頂点 (中心付近) は、書き換わる前に計算しておく
+        chained = is_dest[mirror[dest]]
+        loose = self.mirror_weight_rows(verts, deform_layer, group_indices, flip, mirror, dest[chained])
+
+        # 残りの書き込み先は読み込み先が書き換わらないので、そのまま分けて処理する
+        self.write_weight_chunks(verts, deform_layer, group_indices, flip, mirror, dest[~chained])
+        self.write_weights(loose[0], deform_layer, group_indices, *loose[1:])
+
+        # 書き込み先以外の頂点は、反転で読み終わってから整理だけする
+        if clean_groups:
+            self.write_weight_chunks(verts, deform_layer, group_indices, flip, mirror, np.flatnonzero(~is_dest))
+
+    def write_weight_chunks(self, verts, deform_layer, group_indices, flip, mirror, rows):
+        # 書き込み先1頂点あたり: 読み込み先と2行ずつ、グループごとに float64 のウェイトと bool の割り当てを
+        # 読み込んだ配列・反転した配列・反転中の一時配列の3組持つ
+        cell_bytes = np.dtype(np.float64).itemsize + np.dtype(bool).itemsize
+        row_bytes = 2 * len(group_indices) * cell_bytes * 3
+        for chunk in self.budget.chunks(len(rows), row_bytes):
+            result = self.mirror_weight_rows(verts, deform_layer, group_indices, flip, mirror, rows[chunk])
+            self.write_weights(result[0], deform_layer, group_indices, *result[1:])
+
+    # 整理するグループ: ロックされていない変形用のグループ (UV グループの目印は除く)
+    # アーマチュアモディファイアがあれば、変形するボーンと同じ名前のグループだけにする
+    def get_clean_groups(self):
+        uv_groups = {item.vertex_group for item in self.obj.mio3qs.vglist.items}
+        armatures = [mod.object for mod in self.obj.modifiers if mod.type == "ARMATURE" and mod.object]
+        bones = {bone.name for arm in armatures for bone in arm.data.bones if bone.use_deform}
+        return [
+            vg.index
+            for vg in self.obj.vertex_groups
+            if not vg.lock_weight and vg.name not in uv_groups and (not armatures or vg.name in bones)
+        ]
+
+    # dest の頂点に対称位置のウェイトを反転して入れる (読むのは dest とその対称位置の頂点だけ)
+    def mirror_weight_rows(self, verts, deform_layer, group_indices, flip, mirror, dest):
+        src = mirror[dest]
+        rows = np.unique(np.concatenate([dest, src[src >= 0]]))
+        local = np.full(len(rows), -1, dtype=np.int64)
+        dest_rows = np.searchsorted(rows, dest)
+        local[dest_rows] = np.where(src >= 0, np.searchsorted(rows, src), -1)
+        row_verts = [verts[i] for i in rows.tolist()]
+        weights, assigned = self.read_weights(row_verts, deform_layer, group_indices)
+        new_weights, new_assigned = kernel.mirror_weights(weights, assigned, local, flip)
+        if self.clean_weights and self.clean_columns:
+            new_weights[dest_rows], new_assigned[dest_rows] = kernel.clean_weights(
+                new_weights[dest_rows],
+                new_assigned[dest_rows],
+                self.weight_threshold,
+                self.limit_total,
+                self.normalize,
+                self.clean_columns,
+            )
+        return row_verts, new_weights, new_assigned, weights, assigned
+
+    # 法線
+    def symm_normal(self, co, loop_verts, loop_faces, target_faces, src_normals):
+        src_co, src_loop_verts, src_loop_faces, src_loop_normals = src_normals
+        match = kernel.mirror_loops(
+            co, loop_verts, loop_faces, src_co, src_loop_verts, src_loop_faces, self.tolerance
+        )
+        loops = np.flatnonzero(target_faces[loop_faces])
+        matched = match.index[loops] >= 0
+        ambiguous = np.count_nonzero(np.isin(loops, match.ambiguous))
+        stats = (len(loops) - np.count_nonzero(matched), ambiguous)
+        self.match_stats["Normal"] = stats
+        loops = loops[matched]
+
+        normals = self.get_loop_normals()
+        normals[loops] = kernel.reflect(src_loop_normals[match.index[loops]])
+        self.obj.data.normals_split_custom_set(normals)
+
+        stage_cache.store("normal", self.normal_key, (normals, stats))
+
+    def get_loop_normals(self):
+        mesh = self.obj.data
+        normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+        if hasattr(mesh, "corner_normals"):
+            mesh.corner_normals.foreach_get("vector", normals)
+        else:
+            mesh.calc_normals_split()
+            mesh.loops.foreach_get("normal", normals)
+        return normals.reshape(-1, 3)
+
+    # キャッシュ済みの法線を戻す
+    def restore_normals(self, cached):
+        normals, self.match_stats["Normal"] = cached
+        if self.obj.mode != "OBJECT":
+            bpy.ops.object.mode_set(mode="OBJECT")
+        self.obj.data.normals_split_custom_set(normals)
+
+    # 表情の非対称化
+    def unsymm_facial(self, target_verts):
+        shape_keys = self.obj.data.shape_keys
+        if not shape_keys or not target_verts.any():
+            return
+        key_blocks = shape_keys.key_blocks
+
+        pairs = kernel.facial_pairs(key_blocks.keys(), self.mode)
+        if not pairs:
+            return
+
+        def get_co(i):
+            co = np.empty(len(key_blocks[i].data) * 3, dtype=np.float32)
+            key_blocks[i].data.foreach_get("co", co)
+            return co.reshape(-1, 3)
+
+        # 1組ずつ読んで書き戻し、同時に持つシェイプキーを2つまでにする
+        basis = get_co(0)
+        for target, source in pairs:
+            target_co = get_co(target)
+            source_co = get_co(source)
+            # 1頂点あたり: float64 の xyz を basis・target・source のコピーとマスクで取り出す一時配列の4組
+            for chunk in self.budget.chunks(len(basis), 3 * np.dtype(np.float64).itemsize * 4):
+                target_co[chunk], source_co[chunk] = kernel.unsymmetrize_shape_pair(
+                    basis[chunk], target_co[chunk], source_co[chunk], target_verts[chunk]
+                )
+            key_blocks[target].data.foreach_set("co", target_co.ravel())
+            key_blocks[source].data.foreach_set("co", source_co.ravel())
+        self.obj.data.update()
@@ -0,0 +1,483 @@
+"""Mio3 Symmetry の計算部分
+
+bpy / bmesh に依存しない、配列を受け取って配列を返す関数だけを置く。
+Blender の外 (CI のベンチマーク・回帰テストや .npz に書き出したメッシュの処理) からは
+このファイルを直接読み込んで使う。
+
+配列の形
+    co          (V, 3) 頂点座標
+    loop_verts  (L,)   ループの頂点インデックス
+    loop_faces  (L,)   ループの面インデックス
+    uv          (L, 2) ループの UV
+    weights     (V, G) 頂点ウェイト (assigned が False の要素は未登録)
+"""
+
+from collections import namedtuple
+import numpy as np
+
+SUFFIXES = (
+    ("_r", ".r", "-r", " r", "_R", ".R", "-R", " R", "Right"),
+    ("_l", ".l", "-l", " l", "_L", ".L", "-L", " L", "Left"),
+)
+
+# 左右のサフィックスを持たない表情シェイプキーの読み替え
+REPLACE_NAMES = {
+    "ウィンク": "MMD_Wink_R",
+    "ウィンク右": "MMD_Wink_L",
+    "ウィンク２": "MMD_Wink2_R",
+    "ｳｨﾝｸ２右": "MMD_Wink2_L",
+}
+
+UV_SNAP_DIST = 0.0001
+MIRROR_DIST = 0.0001
+
+
+def side_suffixes(mode):
+    """(対称化で上書きされる側, コピー元の側) のサフィックス"""
+    if mode == "+X":
+        return SUFFIXES[0], SUFFIXES[1]
+    return SUFFIXES[1], SUFFIXES[0]
+
+
+def target_side_mask(x, mode, include_center=True):
+    """上書きされる側にある要素"""
+    x = np.asarray(x)
+    if mode == "+X":
+        return x <= 0 if include_center else x < 0
+    return x >= 0 if include_center else x > 0
+
+
+# 面とループ
+
+
+def loop_faces_from_polygons(face_starts, face_totals, loop_count=None):
+    """各ループが属する面のインデックス"""
+    face_starts = np.asarray(face_starts, dtype=np.int64)
+    face_totals = np.asarray(face_totals, dtype=np.int64)
+    if loop_count is None:
+        loop_count = int(face_totals.sum())
+    face_ids = np.repeat(np.arange(len(face_totals)), face_totals)
+    offsets = np.arange(len(face_ids)) - np.repeat(np.cumsum(face_totals) - face_totals, face_totals)
+    loop_faces = np.full(loop_count, -1, dtype=np.int64)
+    loop_faces[np.repeat(face_starts, face_totals) + offsets] = face_ids
+    return loop_faces
+
+
+def face_any(vert_mask, loop_verts, loop_faces, face_count):
+    """いずれかの頂点が vert_mask に含まれる面"""
+    hits = np.asarray(vert_mask, dtype=bool)[loop_verts]
+    return np.bincount(loop_faces, weights=hits, minlength=face_count) > 0
+
+
+def face_all(vert_mask, loop_verts, loop_faces, face_count):
+    """すべての頂点が vert_mask に含まれる面"""
+    hits = np.asarray(vert_mask, dtype=bool)[loop_verts]
+    totals = np.bincount(loop_faces, minlength=face_count)
+    return (np.bincount(loop_faces, weights=hits, minlength=face_count) == totals) & (totals > 0)
+
+
+def classify_group_faces(group_masks, loop_verts, loop_faces, face_count):
+    """面ごとに所属する UV グループの番号を返す (どのグループにも属さない面は -1)
+
+    すべての頂点がグループに登録されている面が対象で、複数に該当する場合は先のグループを優先する。
+    """
+    face_group = np.full(face_count, -1, dtype=np.int32)
+    for i, mask in enumerate(group_masks):
+        inside = face_all(mask, loop_verts, loop_faces, face_count) & (face_group < 0)
+        face_group[inside] = i
+    return face_group
+
+
+# UV
+
+
+def mirror_uv(uv, u_co=0.5, offset_v=0.0):
+    """U 座標 u_co を軸に反転して V 方向に offset_v ずらす (u_co, offset_v はループごとの配列でもよい)"""
+    uv = np.array(uv, dtype=np.float64).reshape(-1, 2)
+    u_co = np.broadcast_to(np.asarray(u_co, dtype=np.float64), len(uv))
+    u = np.where(np.abs(uv[:, 0] - u_co) < UV_SNAP_DIST, u_co, uv[:, 0])
+    uv[:, 0] = u_co + (u_co - u)
+    uv[:, 1] += offset_v
+    return uv
+
+
+def symmetrize_uv(uv, loop_faces, face_group, face_mask, group_params):
+    """face_mask の面の UV を、グループの (u_co, offset_v) で反転する (グループ外は 0.5 で反転)"""
+    uv = np.array(uv, dtype=np.float64).reshape(-1, 2)
+    params = np.array([(0.5, 0.0)] + [tuple(p) for p in group_params], dtype=np.float64)
+    loops = np.flatnonzero(np.asarray(face_mask, dtype=bool)[loop_faces])
+    p = params[face_group[loop_faces[loops]] + 1]
+    uv[loops] = mirror_uv(uv[loops], p[:, 0], p[:, 1])
+    return uv
+
+
+# 名前
+
+
+def _suffix_index(name, suffixes, start=0):
+    for i, suffix in enumerate(suffixes):
+        if name.endswith(suffix, start):
+            return i
+    return -1
+
+
+def flip_side_name(name):
+    """L/R のサフィックスを反対側に置き換えた名前 (サフィックスがなければ None)"""
+    for side, other in ((0, 1), (1, 0)):
+        i = _suffix_index(name, SUFFIXES[side], 1)
+        if i >= 0:
+            return name[: -len(SUFFIXES[side][i])] + SUFFIXES[other][i]
+    return None
+
+
+def flip_group_indices(names):
+    """各グループの反対側のグループのインデックス (なければ自分自身)"""
+    lookup = {name: i for i, name in enumerate(names)}
+    return [lookup.get(flip_side_name(name), i) for i, name in enumerate(names)]
+
+
+def mirror_group_pairs(names, mode):
+    """反転する頂点グループの (インデックス, 反転先インデックス)
+
+    上書きされる側のサフィックスを持つグループが対象で、反対側のグループがなければ自分自身と組む。
+    """
+    target_suffixes = side_suffixes(mode)[0]
+    lookup = {name: i for i, name in enumerate(names)}
+    pairs = []
+    for i, name in enumerate(names):
+        if _suffix_index(name, target_suffixes, 1) >= 0:
+            pairs.append((i, lookup.get(flip_side_name(name), i)))
+    return pairs
+
+
+def facial_pairs(names, mode):
+    """非対称化する表情シェイプキーの (対象インデックス, コピー元インデックス)"""
+    target_suffixes, source_suffixes = side_suffixes(mode)
+    aliases = [REPLACE_NAMES.get(name, name) for name in names]
+    lookup = {name: i for i, name in enumerate(aliases)}
+    pairs = []
+    for i, name in enumerate(aliases):
+        for target_suffix, source_suffix in zip(target_suffixes, source_suffixes):
+            if name.endswith(target_suffix):
+                source = lookup.get(name[: -len(target_suffix)] + source_suffix)
+                if source is not None:
+                    pairs.append((i, source))
+                    break
+    return pairs
+
+
+# 対称位置の照合
+#
+# 座標をグリッドに量子化してハッシュ表に入れ、反転した座標のセルを引いて対応を探す。
+# 表の構築と検索はベクトル化した線形探索で、要素数に対して期待線形時間で終わる。
+
+MirrorMatch = namedtuple("MirrorMatch", "index unmatched ambiguous")
+MirrorMatch.__doc__ = """照合結果
+
+index      各要素の対応先 (見つからなければ -1、複数あれば最も近いもの)
+unmatched  対応先が見つからなかった要素
+ambiguous  許容距離内に対応先の候補が複数あった要素
+"""
+
+_EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _mix(keys):
+    """splitmix64"""
+    with np.errstate(over="ignore"):
+        z = np.asarray(keys).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return np.where(z == _EMPTY, z - np.uint64(1), z)
+
+
+def _combine(*columns):
+    """整数の列をまとめて1つのキーにする"""
+    key = np.zeros(len(columns[0]), dtype=np.uint64)
+    for column in columns:
+        with np.errstate(over="ignore"):
+            key = _mix(key ^ np.asarray(column).astype(np.uint64))
+    return key
+
+
+class HashTable:
+    """uint64 キーのオープンアドレス法ハッシュ表
+
+    同じキーは同じスロットに入る。slots は各キーのスロット、counts はスロットごとのキー数。
+    """
+
+    def __init__(self, keys):
+        keys = np.asarray(keys, dtype=np.uint64)
+        size = 1 << max(4, (2 * len(keys)).bit_length())
+        self.mask = np.uint64(size - 1)
+        self.keys = np.full(size, _EMPTY, dtype=np.uint64)
+        self.slots = np.empty(len(keys), dtype=np.int64)
+
+        slot = keys & self.mask
+        pending = np.arange(len(keys))
+        while len(pending):
+            s = slot[pending].astype(np.int64)
+            k = keys[pending]
+            empty = self.keys[s] == _EMPTY
+            self.keys[s[empty]] = k[empty]
+            hit = self.keys[s] == k
+            self.slots[pending[hit]] = s[hit]
+            pending = pending[~hit]
+            slot[pending] = (slot[pending] + np.uint64(1)) & self.mask
+
+        self.counts = np.bincount(self.slots, minlength=size)
+
+    def lookup(self, queries):
+        """各クエリのスロット (なければ -1)"""
+        queries = np.asarray(queries, dtype=np.uint64)
+        result = np.full(len(queries), -1, dtype=np.int64)
+        slot = queries & self.mask
+        pending = np.arange(len(queries))
+        while len(pending):
+            s = slot[pending].astype(np.int64)
+            k = self.keys[s]
+            found = k == queries[pending]
+            result[pending[found]] = s[found]
+            pending = pending[~(found | (k == _EMPTY))]
+            slot[pending] = (slot[pending] + np.uint64(1)) & self.mask
+        return result
+
+    def members(self):
+        """スロットごとの要素 (CSR 形式の order, starts)"""
+        order = np.argsort(self.slots, kind="stable")
+        starts = np.cumsum(self.counts) - self.counts
+        return order, starts
+
+
+def _match_result(index, found):
+    return MirrorMatch(index, np.flatnonzero(found == 0), np.flatnonzero(found > 1))
+
+
+def match_points(points, queries, tolerance=MIRROR_DIST):
+    """各クエリ座標から tolerance 以内にある points の要素を探す"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+    index = np.full(len(queries), -1, dtype=np.int64)
+    found = np.zeros(len(queries), dtype=np.int64)
+    if not len(points) or not len(queries):
+        return _match_result(index, found)
+
+    # セルを許容距離の2倍にすると、近い側の隣接セルだけ (2^3 = 8 セル) を調べればよい
+    cell_size = max(float(tolerance), 1e-12) * 2.0
+    table = HashTable(_combine(*np.floor(points / cell_size).astype(np.int64).T))
+    order, starts = table.members()
+
+    scaled = queries / cell_size
+    cells = np.floor(scaled).astype(np.int64)
+    sides = np.where(scaled - cells < 0.5, -1, 1)
+    best = np.full(len(queries), np.inf)
+
+    for offset in np.ndindex(2, 2, 2):
+        slot = table.lookup(_combine(*(cells + sides * np.array(offset)).T))
+        q = np.flatnonzero(slot >= 0)
+        s = slot[q]
+        counts = table.counts[s]
+        for k in range(int(counts.max()) if len(counts) else 0):
+            has = counts > k
+            qq = q[has]
+            candidates = order[starts[s[has]] + k]
+            dist = np.linalg.norm(points[candidates] - queries[qq], axis=1)
+            within = dist <= tolerance
+            qq, candidates, dist = qq[within], candidates[within], dist[within]
+            found[qq] += 1
+            closer = dist < best[qq]
+            best[qq[closer]] = dist[closer]
+            index[qq[closer]] = candidates[closer]
+
+    return _match_result(index, found)
+
+
+def reflect(co, axis=0):
+    co = np.array(co, dtype=np.float64).reshape(-1, 3)
+    co[:, axis] *= -1.0
+    return co
+
+
+def mirror_verts(co, tolerance=MIRROR_DIST):
+    """各頂点の X 対称位置にある頂点"""
+    return match_points(co, reflect(co), tolerance)
+
+
+def mirror_map(co, tolerance=MIRROR_DIST):
+    """各頂点の X 対称位置にある頂点のインデックス (見つからなければ -1)"""
+    return mirror_verts(co, tolerance).index
+
+
+def match_corners(loop_verts, loop_ref_verts, query_verts, query_ref_verts):
+    """(頂点, 隣の頂点) の組でループを照合する
+
+    loop_ref_verts は各ループの前または次のループの頂点。クエリの頂点が -1 のループは対応なしになる。
+    """
+    loop_keys = _combine(loop_verts, loop_ref_verts)
+    table = HashTable(loop_keys)
+    owner = np.full(len(table.keys), -1, dtype=np.int64)
+    owner[table.slots] = np.arange(len(loop_keys))
+
+    query_verts = np.asarray(query_verts)
+    query_ref_verts = np.asarray(query_ref_verts)
+    valid = (query_verts >= 0) & (query_ref_verts >= 0)
+    slot = np.full(len(query_verts), -1, dtype=np.int64)
+    slot[valid] = table.lookup(_combine(query_verts[valid], query_ref_verts[valid]))
+
+    index = np.where(slot >= 0, owner[slot], -1)
+    found = np.where(slot >= 0, table.counts[slot], 0)
+    return _match_result(index, found)
+
+
+def next_loop_verts(loop_verts, loop_faces):
+    """同じ面で次のループの頂点 (ループは面ごとに連続している前提)"""
+    loop_verts = np.asarray(loop_verts)
+    loop_faces = np.asarray(loop_faces)
+    if not len(loop_faces):
+        return loop_verts.copy()
+    next_loops = np.arange(len(loop_faces)) + 1
+    face_ends = np.flatnonzero(np.diff(loop_faces, append=-1))
+    next_loops[face_ends] = np.concatenate(([0], face_ends[:-1] + 1))
+    return loop_verts[next_loops]
+
+
+def prev_loop_verts(loop_verts, loop_faces):
+    """同じ面で前のループの頂点 (ループは面ごとに連続している前提)"""
+    loop_verts = np.asarray(loop_verts)
+    loop_faces = np.asarray(loop_faces)
+    if not len(loop_faces):
+        return loop_verts.copy()
+    prev_loops = np.arange(len(loop_faces)) - 1
+    face_starts = np.flatnonzero(np.diff(loop_faces, prepend=-1))
+    prev_loops[face_starts] = np.append(face_starts[1:], len(loop_faces)) - 1
+    return loop_verts[prev_loops]
+
+
+def mirror_loops(co, loop_verts, loop_faces, src_co, src_loop_verts, src_loop_faces, tolerance=MIRROR_DIST):
+    """各ループの X 対称位置にある src 側のループ
+
+    反転すると面の向きが逆になるので、ループの (頂点, 次の頂点) を src の (頂点, 前の頂点) と照合する。
+    src に同じメッシュを渡せばメッシュ内の対称ループになる。
+    """
+    verts = match_points(src_co, reflect(co), tolerance)
+    query = verts.index[np.asarray(loop_verts)]
+    query_next = verts.index[next_loop_verts(loop_verts, loop_faces)]
+    return match_corners(src_loop_verts, prev_loop_verts(src_loop_verts, src_loop_faces), query, query_next)
+
+
+# ウェイト
+
+
+def target_mirror(mirror, target):
+    """target の頂点だけが対称位置から読み込む対応 (自分自身に対応する中心の頂点は -1)"""
+    mirror = np.asarray(mirror)
+    keep = np.asarray(target, dtype=bool) & (mirror != np.arange(len(mirror)))
+    return np.where(keep, mirror, -1)
+
+
+def mirror_weights(weights, assigned, mirror, flip):
+    """頂点グループのウェイトを反転する
+
+    flip[g] は列 g に入れる反転先の列。対称位置の頂点が見つからない頂点はそのまま残る。
+    """
+    weights = np.array(weights, dtype=np.float64)
+    assigned = np.array(assigned, dtype=bool)
+    mirror = np.asarray(mirror)
+    flip = np.asarray(flip, dtype=np.int64)
+    verts = np.flatnonzero(mirror >= 0)
+    src = mirror[verts]
+    weights[verts] = weights[src][:, flip]
+    assigned[verts] = assigned[src][:, flip]
+    weights[~assigned] = 0.0
+    return weights, assigned
+
+
+def clean_weights(weights, assigned, threshold=0.0, limit=0, normalize=False, columns=None):
+    """ウェイトの整理 (Clean → Limit Total → Normalize All を1回で行う)
+
+    columns の列 (None ならすべて) について、threshold 以下のウェイトを外し、
+    影響数を大きい順に limit 個までにして (0 なら制限しない)、normalize なら各頂点の合計を 1 にする。
+    """
+    weights = np.array(weights, dtype=np.float64)
+    assigned = np.array(assigned, dtype=bool)
+    if columns is None:
+        columns = np.arange(weights.shape[1])
+    columns = np.asarray(columns, dtype=np.int64)
+    w = weights[:, columns]
+    a = assigned[:, columns] & (w > threshold)
+    if limit and len(columns) > limit:
+        order = np.argsort(-np.where(a, w, -1.0), axis=1, kind="stable")
+        np.put_along_axis(a, order[:, limit:], False, axis=1)
+    w[~a] = 0.0
+    if normalize:
+        total = w.sum(axis=1, keepdims=True)
+        np.divide(w, total, out=w, where=total > 0)
+    weights[:, columns] = w
+    assigned[:, columns] = a
+    return weights, assigned
+
+
+# シェイプキー
+
+
+def unsymmetrize_shape_pair(basis, target, source, mask):
+    """mask の頂点について target にコピー元の形状を移し、コピー元は basis に戻す"""
+    target = np.array(target, dtype=np.float64).reshape(-1, 3)
+    source = np.array(source, dtype=np.float64).reshape(-1, 3)
+    basis = np.asarray(basis, dtype=np.float64).reshape(-1, 3)
+    mask = np.asarray(mask, dtype=bool)
+    target[mask] = source[mask]
+    source[mask] = basis[mask]
+    return target, source
+
+
+# インデックス
+
+IndexMap = namedtuple("IndexMap", "verts edges faces loops")
+
+
+def primary_elements(src_index, preferred):
+    """元のインデックスごとに1つだけ選んだ要素
+
+    src_index は各要素の対称化前のインデックス (新しく作られた要素は -1)。
+    複製された要素は元と同じインデックスを持つので、preferred の要素を優先し、その中では先の要素を選ぶ。
+    """
+    src_index = np.asarray(src_index, dtype=np.int64)
+    preferred = np.asarray(preferred, dtype=bool)
+    candidates = np.flatnonzero(src_index >= 0)
+    order = candidates[np.lexsort((candidates, ~preferred[candidates], src_index[candidates]))]
+    sorted_index = src_index[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_index[1:] != sorted_index[:-1]
+    primary = np.zeros(len(src_index), dtype=bool)
+    primary[order[first]] = True
+    return primary
+
+
+def stable_order(src_index, primary):
+    """各要素の新しいインデックス
+
+    primary の要素は元のインデックスに置き、残りの要素は空いた位置に元のインデックス順で詰める。
+    新しく作られた要素は最後に今の順で並べる。
+    """
+    src_index = np.asarray(src_index, dtype=np.int64)
+    count = len(src_index)
+    keep = np.asarray(primary, dtype=bool) & (src_index < count)
+    new_index = np.full(count, -1, dtype=np.int64)
+    new_index[keep] = src_index[keep]
+
+    rest = np.flatnonzero(~keep)
+    rest = rest[np.argsort(np.where(src_index[rest] >= 0, src_index[rest], count), kind="stable")]
+    taken = np.zeros(count, dtype=bool)
+    taken[src_index[keep]] = True
+    new_index[rest] = np.flatnonzero(~taken)
+    return new_index
+
+
+def old_to_new(src_index, primary, new_index, old_count):
+    """対称化前のインデックスから新しいインデックスへの対応 (無くなった要素は -1)"""
+    src_index = np.asarray(src_index, dtype=np.int64)
+    result = np.full(old_count, -1, dtype=np.int64)
+    result[src_index[primary]] = np.asarray(new_index)[primary]
+    return result
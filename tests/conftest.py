@@ -0,0 +1,22 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def addon():
+    """アドオンを mio3symmetry として読み込んで登録する (bpy が必要)"""
+    spec = importlib.util.spec_from_file_location(
+        "mio3symmetry", os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["mio3symmetry"] = module
+    spec.loader.exec_module(module)
+    module.register()
+    yield module
+    module.unregister()
+    del sys.modules["mio3symmetry"]
@@ -0,0 +1,79 @@
+"""ライブミラーを Blender で確認する (bpy がなければスキップ)
+
+bpy モジュール (pip install bpy) か `blender -b --python-expr` から python -m pytest tests/ で実行する。
+"""
+
+import sys
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+import bmesh  # noqa: E402
+
+
+def start(select):
+    """X -1..1 の 10x10 グリッドでライブミラーを始め、select(x, y) に当てはまる頂点を選ぶ"""
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=10, y_subdivisions=10, size=2)
+    obj = bpy.context.active_object
+    obj.vertex_groups.new(name="arm.L")
+    obj.vertex_groups.new(name="arm.R")
+    assert bpy.ops.object.mio3_live_mirror(mode="+X", tolerance=0.01) == {"FINISHED"}
+    return obj, [v.index for v in obj.data.vertices if select(v.co.x, v.co.y)]
+
+
+def select_edit(obj, verts):
+    bpy.ops.mesh.select_all(action="DESELECT")
+    bm = bmesh.from_edit_mesh(obj.data)
+    bm.verts.ensure_lookup_table()
+    for i in verts:
+        bm.verts[i].select = True
+    # 選択の操作として更新させる
+    bpy.ops.mesh.select_all(action="INVERT")
+    bpy.ops.mesh.select_all(action="INVERT")
+
+
+def is_symmetric(obj):
+    bm = bmesh.from_edit_mesh(obj.data)
+    co = {(round(v.co.x, 4), round(v.co.y, 4), round(v.co.z, 4)) for v in bm.verts}
+    return co == {(-x, y, z) for x, y, z in co}
+
+
+def test_edit_mode_mirrors_selected_vertices(addon):
+    obj, verts = start(lambda x, y: x > 0.5 and abs(y) < 0.5)
+    bpy.ops.object.mode_set(mode="EDIT")
+    select_edit(obj, verts)
+    session = sys.modules["mio3symmetry.op_live_mirror"].session
+    assert len(session.selected) == len(verts)
+
+    bpy.ops.transform.translate(value=(0, 0, 0.2))
+    assert is_symmetric(obj)
+    bm = bmesh.from_edit_mesh(obj.data)
+    assert sum(1 for v in bm.verts if v.co.z > 0.1) == 2 * len(verts)
+    bpy.ops.object.mio3_live_mirror()
+
+
+def test_weight_paint_mask_and_native_mirror(addon):
+    obj, verts = start(lambda x, y: x > 0.5)
+    mesh = obj.data
+    mesh.use_paint_mask_vertex = True
+    bpy.ops.object.mode_set(mode="WEIGHT_PAINT")
+    for v in mesh.vertices:
+        v.select = v.index in verts
+    mesh.update()
+    bpy.context.view_layer.update()
+
+    obj.vertex_groups["arm.L"].add(verts, 0.7, "REPLACE")
+    mesh.update()
+    bpy.context.view_layer.update()
+    right = obj.vertex_groups["arm.R"].index
+    mirrored = [v for v in mesh.vertices if any(g.group == right and abs(g.weight - 0.7) < 1e-6 for g in v.groups)]
+    assert len(mirrored) == len(verts)
+
+    # マスクが無い間は Blender の X ミラーを使い、ライブミラーを止めると元に戻す
+    mesh.use_paint_mask_vertex = False
+    mesh.update()
+    bpy.context.view_layer.update()
+    assert mesh.use_mirror_x and mesh.use_mirror_vertex_groups
+    bpy.ops.object.mio3_live_mirror()
+    assert not mesh.use_mirror_x
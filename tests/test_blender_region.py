@@ -0,0 +1,83 @@
+"""Selected Only の対称化を Blender で確認する (bpy がなければスキップ)
+
+bpy モジュール (pip install bpy) か `blender -b --python-expr` から python -m pytest tests/ で実行する。
+"""
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+import bmesh  # noqa: E402
+
+
+def make_grid(select):
+    """X -1..1 の 10x10 グリッド (X=0 に頂点の列がある) を作り、select(x, y) に当てはまる頂点を選択する
+
+    選択した中心以外の頂点は左右で違う高さに動かして、対称化で揃うかを見る。
+    (対称位置は許容距離 0.1 で見つかる程度にずらす)
+    """
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=10, y_subdivisions=10, size=2)
+    obj = bpy.context.active_object
+    for v in obj.data.vertices:
+        v.select = select(v.co.x, v.co.y)
+        if v.select and abs(v.co.x) > 1e-6:
+            v.co.z = 0.03 if v.co.x > 0 else -0.03
+    obj.data.update()
+    return obj
+
+
+def mesh_stats(obj):
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    faces = {tuple(sorted((round(v.co.x, 4), round(v.co.y, 4)) for v in f.verts)) for f in bm.faces}
+    stats = {
+        "verts": len(bm.verts),
+        "faces": len(bm.faces),
+        "unique_faces": len(faces),
+        "loose_edges": sum(1 for e in bm.edges if not e.link_faces),
+        "boundary_edges": sum(1 for e in bm.edges if e.is_boundary),
+    }
+    co = {(round(v.co.x, 4), round(v.co.y, 4), round(v.co.z, 4)) for v in bm.verts}
+    stats["symmetric"] = co == {(-x, y, z) for x, y, z in co}
+    bm.free()
+    return stats
+
+
+@pytest.mark.parametrize(
+    "select",
+    [
+        # 対称側だけの選択 (周りは選択していない面)
+        lambda x, y: -0.8 <= x <= -0.2 and -0.3 <= y <= 0.3,
+        # 中心をまたぐ選択
+        lambda x, y: -0.5 <= x <= 0.5 and -0.3 <= y <= 0.3,
+        # コピー元側だけの選択
+        lambda x, y: 0.2 <= x <= 0.8 and -0.3 <= y <= 0.3,
+    ],
+)
+def test_selected_only_keeps_surrounding_topology(addon, select):
+    obj = make_grid(select)
+    before = mesh_stats(obj)
+    result = bpy.ops.object.mio3_symmetry(selected_only=True, normal=False, uvmap=False, tolerance=0.1)
+    assert result == {"FINISHED"}
+    after = mesh_stats(obj)
+    # 穴・重なり・はぐれた辺ができずに元と同じつながりのまま、左右対称になる
+    assert not before["symmetric"]
+    assert after == dict(before, symmetric=True)
+
+
+def test_keep_indices_keeps_source_elements(addon):
+    obj = make_grid(lambda x, y: False)
+    mesh = obj.data
+    source = {v.index: v.co.copy() for v in mesh.vertices if v.co.x > 1e-6}
+    loops = [(loop.index, loop.vertex_index) for loop in mesh.loops]
+    result = bpy.ops.object.mio3_symmetry(keep_indices=True, normal=False, uvmap=False, tolerance=0.1)
+    assert result == {"FINISHED"}
+
+    # コピー元側の頂点は同じインデックスに残り、ループは対応を引くと同じ頂点を指す
+    for i, co in source.items():
+        assert (mesh.vertices[i].co - co).length < 1e-6
+    index_map = addon.op_symmetrize.get_index_map(mesh)
+    for old, vert in loops:
+        new = index_map.loops[old]
+        if vert in source:
+            assert new >= 0 and mesh.loops[new].vertex_index == index_map.verts[vert] == vert
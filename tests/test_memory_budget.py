@@ -0,0 +1,51 @@
+"""memory_budget のテスト (Blender なしで `python -m pytest tests/` で実行する)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_budget import MB, MemoryBudget  # noqa: E402
+
+
+def test_chunks_unlimited_is_one_slice():
+    assert list(MemoryBudget().chunks(5000, 64)) == [slice(0, 5000)]
+
+
+def test_chunks_empty():
+    assert list(MemoryBudget().chunks(0, 64)) == []
+    assert list(MemoryBudget(64).chunks(0, 64)) == []
+
+
+def test_chunks_fit_budget():
+    budget = MemoryBudget(64)
+    size = int(64 * MB * MemoryBudget.chunk_fraction // 1024)
+    chunks = list(budget.chunks(3 * size + 10, 1024))
+    assert [c.stop - c.start for c in chunks] == [size, size, size, 10]
+    assert chunks[-1].stop == 3 * size + 10
+
+
+def test_chunks_min_chunk():
+    budget = MemoryBudget(64)
+    chunks = list(budget.chunks(5000, 64 * MB))
+    assert [c.stop - c.start for c in chunks] == [1024] * 4 + [5000 - 4096]
+
+
+def test_over_budget():
+    budget = MemoryBudget(64)
+    budget.peaks = {"UV": 10 * MB, "Shape Keys": 100 * MB}
+    assert budget.over_budget() == ["Shape Keys"]
+    assert budget.summary() == "UV: 10.0  Shape Keys: 100.0"
+
+
+def test_stage_records_only_with_budget():
+    budget = MemoryBudget()
+    with budget.stage("UV"):
+        pass
+    assert budget.peaks == {}
+    budget = MemoryBudget(64)
+    with budget.stage("UV"):
+        data = bytearray(8 * MB)
+    del data
+    if budget.measure:
+        assert budget.peaks["UV"] >= 0
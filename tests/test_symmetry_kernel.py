@@ -0,0 +1,155 @@
+"""symmetry_kernel の回帰テスト
+
+Blender なしで `python -m pytest tests/` か `python tests/test_symmetry_kernel.py` で実行する。
+(tests/pytest.ini で rootdir を tests にして、アドオンの __init__.py を読み込ませない)
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import symmetry_kernel as kernel  # noqa: E402
+
+
+def test_match_points_finds_nearest_within_tolerance():
+    points = np.array([[1.0, 0.0, 0.0], [2.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    queries = np.array([[1.00004, 0.0, 0.0], [2.0, 0.0, 0.00003], [5.0, 5.0, 5.0]])
+    match = kernel.match_points(points, queries, 0.0001)
+    assert match.index.tolist() == [0, 1, -1]
+    assert match.unmatched.tolist() == [2]
+    assert match.ambiguous.tolist() == []
+
+
+def test_match_points_reports_ambiguous_across_cells():
+    # セルの境界をまたぐ2点のどちらにも届くクエリ
+    points = np.array([[0.00019, 0.0, 0.0], [0.00021, 0.0, 0.0]])
+    match = kernel.match_points(points, [[0.0002, 0.0, 0.0]], 0.0001)
+    assert match.index[0] in (0, 1)
+    assert match.ambiguous.tolist() == [0]
+
+
+def test_mirror_map_pairs_sides_and_center():
+    co = np.array([[1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.5, 0.5, 0.0]])
+    assert kernel.mirror_map(co).tolist() == [1, 0, 2, -1]
+
+
+def test_mirror_weights_writes_target_side_only():
+    # 列 0 が Hand_L、列 1 が Hand_R。対称化直後は対称側もコピー元と同じ Hand_L
+    co = np.array([[1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    weights = np.array([[1.0, 0.0], [1.0, 0.0], [0.5, 0.0]])
+    assigned = weights > 0
+    mirror = kernel.target_mirror(kernel.mirror_map(co), kernel.target_side_mask(co[:, 0], "+X"))
+    new_weights, new_assigned = kernel.mirror_weights(weights, assigned, mirror, [1, 0])
+    assert new_weights.tolist() == [[1.0, 0.0], [0.0, 1.0], [0.5, 0.0]]
+    assert new_assigned.tolist() == [[True, False], [False, True], [True, False]]
+
+
+def test_mirror_weights_keeps_unmatched_vertices():
+    weights = np.array([[0.3, 0.0], [0.7, 0.2]])
+    assigned = weights > 0
+    new_weights, new_assigned = kernel.mirror_weights(weights, assigned, [-1, -1], [1, 0])
+    assert np.array_equal(new_weights, weights)
+    assert np.array_equal(new_assigned, assigned)
+
+
+def test_clean_weights_only_touches_given_columns():
+    weights = np.array([[0.6, 0.3, 0.00001, 0.1, 0.9]])
+    assigned = np.ones(weights.shape, dtype=bool)
+    new_weights, new_assigned = kernel.clean_weights(weights, assigned, 0.0001, 2, True, [0, 1, 2, 3])
+    # 列 4 (ロックや UV グループ) はそのまま
+    assert np.allclose(new_weights, [[2 / 3, 1 / 3, 0.0, 0.0, 0.9]])
+    assert new_assigned.tolist() == [[True, True, False, False, True]]
+
+
+def test_symmetrize_uv_uses_group_params():
+    uv = np.array([[0.3, 0.1], [0.4, 0.2], [0.8, 0.5], [0.9, 0.6]], dtype=np.float32)
+    loop_faces = np.array([0, 0, 1, 1])
+    face_group = np.array([-1, 0])
+    face_mask = np.array([True, True])
+    result = kernel.symmetrize_uv(uv, loop_faces, face_group, face_mask, [(0.75, 0.25)])
+    assert np.allclose(result, [[0.7, 0.1], [0.6, 0.2], [0.7, 0.75], [0.6, 0.85]])
+
+
+def test_symmetrize_uv_skips_unmasked_faces():
+    uv = np.array([[0.3, 0.1], [0.4, 0.2]])
+    result = kernel.symmetrize_uv(uv, np.array([0, 1]), np.array([-1, -1]), np.array([False, True]), [])
+    assert np.allclose(result, [[0.3, 0.1], [0.6, 0.2]])
+
+
+def test_classify_group_faces_prefers_first_group():
+    # 面 0 は頂点 0-2、面 1 は頂点 2-4
+    loop_verts = np.array([0, 1, 2, 2, 3, 4])
+    loop_faces = np.array([0, 0, 0, 1, 1, 1])
+    masks = np.array([[True, True, True, True, False], [True, True, True, True, True]])
+    assert kernel.classify_group_faces(masks, loop_verts, loop_faces, 2).tolist() == [0, 1]
+    assert kernel.classify_group_faces(np.zeros((0, 5), dtype=bool), loop_verts, loop_faces, 2).tolist() == [-1, -1]
+
+
+def test_mirror_loops_matches_reversed_corners():
+    co = np.array([[1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [-1.0, 1.0, 0.0], [-1.0, 0.0, 0.0]])
+    loop_verts = np.array([0, 1, 2, 3])
+    loop_faces = np.array([0, 0, 0, 0])
+    match = kernel.mirror_loops(co, loop_verts, loop_faces, co, loop_verts, loop_faces)
+    assert match.index.tolist() == [3, 2, 1, 0]
+    assert len(match.unmatched) == 0
+
+
+def test_flip_side_name():
+    assert kernel.flip_side_name("Hand_L") == "Hand_R"
+    assert kernel.flip_side_name("Arm.r") == "Arm.l"
+    assert kernel.flip_side_name("LegLeft") == "LegRight"
+    assert kernel.flip_side_name("Body") is None
+    # 1文字だけの名前はサフィックスとみなさない
+    assert kernel.flip_side_name("_L") is None
+
+
+def test_mirror_group_pairs_targets_overwritten_side():
+    names = ["Hand_L", "Hand_R", "Body", "Eye.R"]
+    assert kernel.mirror_group_pairs(names, "+X") == [(1, 0), (3, 3)]
+    assert kernel.mirror_group_pairs(names, "-X") == [(0, 1)]
+
+
+def test_facial_pairs_and_replace_names():
+    names = ["Basis", "Smile_L", "Smile_R", "ウィンク", "ウィンク右", "Blink"]
+    assert kernel.facial_pairs(names, "+X") == [(2, 1), (3, 4)]
+    assert kernel.facial_pairs(names, "-X") == [(1, 2), (4, 3)]
+
+
+def test_unsymmetrize_shape_pair_moves_masked_side():
+    basis = np.zeros((2, 3))
+    target = np.array([[1.0, 1.0, 1.0], [2.0, 2.0, 2.0]])
+    source = np.array([[3.0, 3.0, 3.0], [4.0, 4.0, 4.0]])
+    new_target, new_source = kernel.unsymmetrize_shape_pair(basis, target, source, [True, False])
+    assert new_target.tolist() == [[3.0, 3.0, 3.0], [2.0, 2.0, 2.0]]
+    assert new_source.tolist() == [[0.0, 0.0, 0.0], [4.0, 4.0, 4.0]]
+
+def test_stable_order_keeps_source_indices():
+    # 0,1,2 がコピー元側、3,4 が削除された対称側、5 が中心。-1 は二等分で作られた頂点
+    src_index = np.array([5, -1, 2, 0, 1, 0, 1, 2])
+    preferred = np.array([True, True, True, True, True, False, False, False])
+    primary = kernel.primary_elements(src_index, preferred)
+    new_index = kernel.stable_order(src_index, primary)
+    assert sorted(new_index.tolist()) == list(range(len(src_index)))
+    assert new_index[[3, 4, 2, 0]].tolist() == [0, 1, 2, 5]
+    # 複製は空いた位置に元のインデックス順で入り、新しい頂点は最後
+    assert new_index[[5, 6, 7, 1]].tolist() == [3, 4, 6, 7]
+    old_to_new = kernel.old_to_new(src_index, primary, new_index, 6)
+    assert old_to_new.tolist() == [0, 1, 2, -1, -1, 5]
+
+
+def test_stable_order_moves_indices_past_the_end():
+    src_index = np.array([3, 0])
+    primary = kernel.primary_elements(src_index, [True, True])
+    new_index = kernel.stable_order(src_index, primary)
+    assert new_index.tolist() == [1, 0]
+    assert kernel.old_to_new(src_index, primary, new_index, 4).tolist() == [0, -1, -1, 1]
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_"):
+            func()
+    print("ok")